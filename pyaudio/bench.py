@@ -0,0 +1,265 @@
+# bench.py
+# Microbenchmarks for the analysis / encode hot paths at the block sizes we deploy.
+#
+# Stages:
+#   wledAR2.compute_features, wledAR2.encode_packet,
+#   main.AudioAnalyzer.analyze_audio / split_frequency_bands / create_led_data
+#
+# Every stage is fed deterministic synthetic signals (seeded). No recording ships
+# with the repo, so recorded material is only included when passed with --wav;
+# baselines meant for comparison should be made with the same --wav set. Results
+# are written as JSON with ns/block and the share of the real-time budget (block
+# duration at the signal's sample rate).
+#
+#   python bench.py --out bench.json
+#   python bench.py --out new.json --compare bench.json --threshold 15   # exit 1 on regression
+#
+# --compare refuses a baseline whose meta records different code-path settings
+# (CALIB, sample rates, ...) and warns when host/Python/NumPy differ.
+
+import argparse, json, os, platform, sys, time, wave
+import numpy as np
+
+import wledAR2
+import main as legacy
+
+BLOCK_SIZES = (256, 512, 1024, 2048, 4096)
+SEED = 1234
+
+
+# ── Signals ─────────────────────────────────────────────────────────────────────
+def synth_signals(sr, seconds=2.0):
+    """Deterministic stereo float32 test signals: {name: (samples (N, 2), sr)}."""
+    n = int(sr * seconds)
+    t = np.arange(n, dtype=np.float64) / sr
+    rng = np.random.default_rng(SEED)
+
+    # log sweep 30 Hz → 10 kHz
+    f0, f1 = 30.0, 10000.0
+    k = np.log(f1 / f0) / seconds
+    sweep = 0.5 * np.sin(2 * np.pi * f0 * (np.exp(k * t) - 1.0) / k)
+
+    # kick-like pulses at 120 BPM over low-level noise
+    beat = (t % 0.5)
+    kick = 0.8 * np.exp(-beat * 30.0) * np.sin(2 * np.pi * 60.0 * beat) + 0.02 * rng.standard_normal(n)
+
+    sigs = {
+        "silence": np.zeros(n),
+        "noise": 0.3 * rng.standard_normal(n),
+        "sweep": sweep,
+        "kick": kick,
+    }
+    return {name: (np.stack([x, x], axis=1).astype(np.float32), sr) for name, x in sigs.items()}
+
+
+def load_wav(path):
+    """Read a 16-bit PCM WAV as stereo float32 (N, 2) plus its sample rate."""
+    with wave.open(path, "rb") as w:
+        if w.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM is supported")
+        ch, sr = w.getnchannels(), w.getframerate()
+        x = np.frombuffer(w.readframes(w.getnframes()), dtype="<i2").astype(np.float32) / 32768.0
+    x = x.reshape(-1, ch)
+    if ch == 1:
+        x = np.repeat(x, 2, axis=1)
+    return x[:, :2].copy(), sr
+
+
+def blocks_of(sig, bs, max_blocks=64):
+    n = min(len(sig) // bs, max_blocks)
+    if n == 0:
+        raise ValueError(f"signal too short for block size {bs}")
+    return [sig[i * bs:(i + 1) * bs] for i in range(n)]
+
+
+# ── Timing ──────────────────────────────────────────────────────────────────────
+def time_stage(fn, inputs, repeats, min_calls):
+    """Median ns per call over `repeats` runs, each cycling through `inputs`."""
+    calls = max(min_calls, len(inputs))
+    for i in range(min(calls, 8)):       # warm-up (caches, FFT plans, state)
+        fn(inputs[i % len(inputs)])
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter_ns()
+        for i in range(calls):
+            fn(inputs[i % len(inputs)])
+        samples.append((time.perf_counter_ns() - t0) / calls)
+    return float(np.median(samples))
+
+
+def make_analyzer(bs):
+    """AudioAnalyzer resized to block size bs (main.py sizes it from FRAME_SIZE).
+    The caller closes a.sock."""
+    a = legacy.AudioAnalyzer()
+    a.fft_size = bs
+    a.freqs = np.fft.fftfreq(bs, 1 / legacy.RATE)
+    a.window = np.hanning(bs)
+    return a
+
+
+def stages_for(bs, blocks, a):
+    """Yield (stage_name, fn, inputs) for one block size; a is a make_analyzer(bs)."""
+    yield "wledAR2.compute_features", wledAR2.compute_features, blocks
+
+    feats = [wledAR2.compute_features(b) for b in blocks]
+    yield "wledAR2.encode_packet", lambda f: wledAR2.encode_packet(*f), feats
+
+    mono = [b.mean(axis=1) for b in blocks]
+    yield "main.analyze_audio", a.analyze_audio, mono
+
+    mags = [np.abs(np.fft.fft(m * a.window)[:bs // 2]) for m in mono]
+    yield "main.split_frequency_bands", a.split_frequency_bands, mags
+
+    analyses = [a.analyze_audio(m) for m in mono]
+    yield "main.create_led_data", a.create_led_data, analyses
+
+
+def run(signals, block_sizes, repeats, min_calls):
+    results = {}
+    for bs in block_sizes:
+        a = make_analyzer(bs)
+        try:
+            for sig_name, (sig, sr) in signals.items():
+                run_signal(results, bs, sig_name, sig, sr, a, repeats, min_calls)
+        finally:
+            a.sock.close()
+    return results
+
+
+def run_signal(results, bs, sig_name, sig, sr, a, repeats, min_calls):
+    blocks = blocks_of(sig, bs)
+    budget_ns = bs / sr * 1e9   # real-time budget at the signal's own rate
+    for stage, fn, inputs in stages_for(bs, blocks, a):
+        ns = time_stage(fn, inputs, repeats, min_calls)
+        results.setdefault(stage, {}).setdefault(str(bs), {})[sig_name] = {
+            "ns_per_block": round(ns, 1),
+            "pct_budget": round(100.0 * ns / budget_ns, 4),
+            "sample_rate": sr,
+        }
+        print(f"{stage:30s} bs={bs:5d} {sig_name:10s} {ns / 1e3:10.1f} us  {100.0 * ns / budget_ns:7.3f}% of budget")
+
+
+# ── Comparison ──────────────────────────────────────────────────────────────────
+# Meta keys that change which code runs: comparing across them is meaningless.
+CODE_PATH_META = ("sample_rate", "legacy_rate", "calib", "calib_norm", "band_comp_exp")
+# Meta keys that describe the host: differences are reported, not fatal.
+HOST_META = ("python", "numpy", "machine", "processor", "system")
+
+
+def run_meta(args):
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "system": platform.system(),
+        "sample_rate": wledAR2.SR,
+        "legacy_rate": legacy.RATE,
+        "calib": bool(wledAR2.CALIB),             # CALIB=1 adds a calibrator update per block
+        "calib_norm": wledAR2.CALIB_NORM,         # > 0 adds the per-band normalizer
+        "band_comp_exp": wledAR2.BAND_COMP_EXP,
+        "repeats": args.repeats,
+        "min_calls": args.min_calls,
+    }
+
+
+def meta_diff(baseline_meta, current_meta, keys):
+    return [f"{k}: baseline={baseline_meta.get(k)!r} now={current_meta.get(k)!r}"
+            for k in keys if baseline_meta.get(k) != current_meta.get(k)]
+
+
+def _keys(results):
+    return {(stage, bs, sig) for stage, by_bs in results.items()
+            for bs, by_sig in by_bs.items() for sig in by_sig}
+
+
+def compare(baseline, current, threshold_pct):
+    """Compare current against baseline.
+
+    Returns (regressions, missing, compared): messages for entries slower than
+    baseline by > threshold_pct, messages for entries present on only one side,
+    and the number of entries actually compared.
+    """
+    base_keys, cur_keys = _keys(baseline), _keys(current)
+    missing = [f"{stage} bs={bs} {sig}: not in baseline" for stage, bs, sig in sorted(cur_keys - base_keys)]
+    missing += [f"{stage} bs={bs} {sig}: not in this run" for stage, bs, sig in sorted(base_keys - cur_keys)]
+
+    regressions = []
+    compared = 0
+    for stage, bs, sig in sorted(base_keys & cur_keys):
+        old = baseline[stage][bs][sig]["ns_per_block"]
+        new = current[stage][bs][sig]["ns_per_block"]
+        if old <= 0:
+            continue
+        compared += 1
+        delta = 100.0 * (new - old) / old
+        if delta > threshold_pct:
+            regressions.append(f"{stage} bs={bs} {sig}: {old:.0f} -> {new:.0f} ns (+{delta:.1f}%)")
+    return regressions, missing, compared
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the audio analysis and encode hot paths.")
+    ap.add_argument("--out", default="bench.json", help="where to write the JSON results")
+    ap.add_argument("--wav", action="append", default=[], help="recorded 16-bit WAV to include (repeatable)")
+    ap.add_argument("--block-sizes", default=",".join(map(str, BLOCK_SIZES)), help="comma-separated block sizes")
+    ap.add_argument("--repeats", type=int, default=7, help="timed runs per stage; the median is reported")
+    ap.add_argument("--min-calls", type=int, default=200, help="calls per timed run")
+    ap.add_argument("--compare", metavar="BASELINE", help="baseline JSON; exit 1 if any stage regresses")
+    ap.add_argument("--threshold", type=float, default=15.0, help="allowed slowdown in percent for --compare")
+    ap.add_argument("--allow-meta-mismatch", action="store_true",
+                    help="compare even if CALIB/sample-rate settings differ from the baseline")
+    args = ap.parse_args()
+
+    block_sizes = [int(b) for b in args.block_sizes.split(",") if b]
+    signals = synth_signals(wledAR2.SR)
+    for path in args.wav:
+        x, sr = load_wav(path)
+        if sr != wledAR2.SR:
+            print(f"[bench] note: {path} is {sr} Hz; stages analyse it as {wledAR2.SR} Hz, "
+                  f"budget uses {sr} Hz")
+        signals["wav:" + os.path.basename(path)] = (x, sr)
+
+    results = run(signals, block_sizes, args.repeats, args.min_calls)
+    report = {"meta": run_meta(args), "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[bench] wrote {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            base_report = json.load(f)
+        baseline = base_report["results"]
+        base_meta = base_report.get("meta", {})
+        host = meta_diff(base_meta, report["meta"], HOST_META)
+        if host:
+            print("[bench] warning: baseline was recorded on a different host/toolchain:")
+            for d in host:
+                print("  " + d)
+        code = meta_diff(base_meta, report["meta"], CODE_PATH_META)
+        if code:
+            print("[bench] baseline was recorded with different settings:")
+            for d in code:
+                print("  " + d)
+            if not args.allow_meta_mismatch:
+                print("[bench] refusing to compare (use --allow-meta-mismatch to override)")
+                return 1
+        regressions, missing, compared = compare(baseline, results, args.threshold)
+        if missing:
+            print(f"[bench] warning: {len(missing)} entr{'y' if len(missing) == 1 else 'ies'} not on both sides:")
+            for m in missing:
+                print("  " + m)
+        if compared == 0:
+            print(f"[bench] nothing to compare: no stage/block size/signal in common with {args.compare}")
+            return 1
+        if regressions:
+            print(f"[bench] {len(regressions)} regression(s) beyond {args.threshold:g}%:")
+            for r in regressions:
+                print("  " + r)
+            return 1
+        print(f"[bench] no regressions beyond {args.threshold:g}% in {compared} entries vs {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
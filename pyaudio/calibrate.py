@@ -0,0 +1,190 @@
+# calibrate.py
+# Streaming per-band noise-floor and level calibration for the 16 GEQ bands.
+#
+# State is fixed-size (a few float32[16] arrays + two scalars), updated vectorized
+# once per block:
+#   floor – per-band noise ceiling: a high-percentile tracker (stochastic quantile
+#           estimate in the log domain, so one step size works from hiss at 1e-4 up
+#           to hum at 1+) that only learns on quiet blocks. A block is quiet when its
+#           RMS is below QUIET_RMS and within quiet_gate of the quietest level seen
+#           recently, so sustained music never trains the floor. The value
+#           subtracted is floor * margin.
+#   level – slow EMA of each band's level above its floor; used to pull bands toward
+#           a common level so a hot bass band doesn't flatten the treble.
+# Learned state is saved to JSON so a restart doesn't need to re-learn the room.
+
+import json, os, time
+import numpy as np
+
+_EPS = 1e-9
+
+
+class BandCalibrator:
+    """Per-band noise floor (learned on quiet blocks only) + relative level normalizer."""
+
+    def __init__(self, n_bands=16, quantile=0.95, floor_step=0.02, level_alpha=0.002,
+                 norm_strength=0.5, max_norm_gain=4.0, init_floor=0.01, min_floor=1e-4,
+                 margin=2.0, quiet_rms=0.01, quiet_gate=3.0, quiet_rise=0.002, min_rms=1e-5):
+        self.n_bands = int(n_bands)
+        self.quantile = float(quantile)            # 0.9..0.99; percentile of quiet-block level treated as the floor
+        self.floor_step = float(floor_step)        # log-domain step per quiet block; larger = adapts faster
+        self.level_alpha = float(level_alpha)      # EMA weight for per-band level
+        self.norm_strength = float(norm_strength)  # 0 = no per-band normalization, 1 = full
+        self.max_norm_gain = float(max_norm_gain)  # clamp so near-silent bands aren't blown up
+        self.margin = float(margin)                # subtract floor * margin to clear the noise's tail
+        # Quiet gate: absolute ceiling (block RMS, ~-40 dBFS) plus a relative one against
+        # a min-tracker that drops instantly and rises by quiet_rise (log) per block.
+        self.quiet_rms = float(quiet_rms)
+        self.log_quiet_gate = float(np.log(quiet_gate))
+        self.quiet_rise = float(quiet_rise)
+        self.log_min_rms = float(np.log(min_rms))
+        self.log_rms_min = float(np.log(quiet_rms))
+        # digital silence would otherwise walk the floor down forever and it would
+        # take minutes to climb back once real hiss returns
+        self.log_min_floor = np.float32(np.log(min_floor))
+        self.log_floor = np.full(self.n_bands, np.log(init_floor + _EPS), dtype=np.float32)
+        self.level = np.zeros(self.n_bands, dtype=np.float32)
+        self.blocks = 0
+        # scratch buffers so update() doesn't allocate per block
+        self._logx = np.empty(self.n_bands, dtype=np.float32)
+        self._below = np.empty(self.n_bands, dtype=bool)
+        self._out = np.empty(self.n_bands, dtype=np.float32)
+        self._gain = np.empty(self.n_bands, dtype=np.float32)
+
+    @property
+    def floor(self):
+        return np.exp(self.log_floor)
+
+    def is_quiet(self, rms):
+        """Track the quietest recent block RMS and say whether this block is near it."""
+        log_rms = float(np.log(max(rms, 0.0) + _EPS))
+        self.log_rms_min = max(self.log_min_rms, min(log_rms, self.log_rms_min + self.quiet_rise))
+        return rms < self.quiet_rms and log_rms < self.log_rms_min + self.log_quiet_gate
+
+    def update(self, bands, rms):
+        """Learn from one block of raw band magnitudes (block RMS rms) and return them
+        with floor * margin subtracted and level-normalized (float32[n_bands], >= 0).
+        The returned array is reused."""
+        x = np.asarray(bands, dtype=np.float32)
+
+        if self.is_quiet(rms):
+            # Quantile tracker: step up by q*s when above, down by (1-q)*s when below.
+            # At equilibrium a fraction q of quiet blocks sits below the estimate.
+            np.log(x + _EPS, out=self._logx)
+            np.less(self._logx, self.log_floor, out=self._below)
+            self.log_floor += self.floor_step * (self.quantile - self._below)
+            np.maximum(self.log_floor, self.log_min_floor, out=self.log_floor)
+
+        out = self._out
+        np.subtract(x, np.exp(self.log_floor) * self.margin, out=out)
+        np.maximum(out, 0.0, out=out)
+
+        # Per-band level above floor, normalized relative to the across-band mean
+        self.level *= (1.0 - self.level_alpha)
+        self.level += self.level_alpha * out
+        self.blocks += 1
+        if self.norm_strength > 0.0:
+            gain = self._gain
+            np.divide(self.level.mean() + _EPS, self.level + _EPS, out=gain)
+            np.power(gain, self.norm_strength, out=gain)
+            np.clip(gain, 1.0 / self.max_norm_gain, self.max_norm_gain, out=gain)
+            out *= gain
+        return out
+
+    # ── Persistence ─────────────────────────────────────────────────────────────
+    def state(self):
+        return {
+            "n_bands": self.n_bands,
+            "floor": [float(v) for v in self.floor],
+            "level": [float(v) for v in self.level],
+            "blocks": int(self.blocks),
+            "saved_at": time.time(),
+        }
+
+    def load(self, path):
+        """Restore floors/levels from path. Returns True if state was loaded."""
+        try:
+            with open(path) as f:
+                st = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            print(f"[CALIB] could not read {path}: {e}")
+            return False
+        try:
+            if st.get("n_bands") != self.n_bands:
+                print(f"[CALIB] ignoring {path}: band count {st.get('n_bands')} != {self.n_bands}")
+                return False
+            floor = np.asarray(st["floor"], dtype=np.float32)
+            level = np.asarray(st["level"], dtype=np.float32)
+            if floor.shape != (self.n_bands,) or level.shape != (self.n_bands,):
+                raise ValueError(f"expected {self.n_bands} floor/level values")
+            if not (np.all(np.isfinite(floor) & (floor > 0)) and np.all(np.isfinite(level))):
+                raise ValueError("floor must be finite and > 0, level finite")
+            blocks = int(st.get("blocks", 0))
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            print(f"[CALIB] ignoring malformed {path}: {e!r}")
+            return False
+        self.log_floor[:] = np.log(floor + _EPS)
+        self.level[:] = level
+        self.blocks = blocks
+        return True
+
+    def save(self, path):
+        """Write state atomically (tmp + rename) so a crash can't leave a torn file."""
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state(), f)
+        os.replace(tmp, path)
+
+
+def _self_check_run(cal, signal, seconds, sr=44100, bs=512, seed=0):
+    """Feed cal `seconds` of signal(rng, n) blocks through a wledAR2-like band split
+    and AGC; return (compressed band values of the last second, number of bands
+    that have any FFT bins at this block size)."""
+    edges = np.geomspace(30.0, 10000.0, 17)
+    freqs = np.fft.rfftfreq(bs, 1.0 / sr)
+    win = np.hanning(bs)
+    masks = [(freqs >= edges[i]) & (freqs < edges[i + 1]) for i in range(16)]
+    rng = np.random.default_rng(seed)
+    comp_exp, scale = 0.45, 220.0   # wledAR2 BAND_COMP_EXP, BAND_SCALE
+    n = int(seconds * sr / bs)
+    tail = []
+    for k in range(n):
+        x = signal(rng, k * bs, bs, sr)
+        rms = float(np.sqrt(np.mean(x * x) + 1e-12))
+        mag = np.abs(np.fft.rfft(x * win))
+        raw = np.array([mag[m].mean() if m.any() else 0.0 for m in masks])
+        gain = min(50.0, 1.0 / rms) * 0.8                  # AGC at its target; maxes out (50) in silence
+        v = np.power(cal.update(raw, rms) * gain, comp_exp) * scale
+        if k >= n - sr // bs:
+            tail.append(v)
+    return np.array(tail), sum(bool(m.any()) for m in masks)
+
+
+if __name__ == "__main__":
+    # Self-check:  python calibrate.py
+    #   1. hiss-only input must map to empty bands even at max AGC gain;
+    #   2. sustained music after the hiss must still light the bands a minute later.
+    def hiss(rng, t0, n, sr):
+        return rng.normal(0.0, 3e-4, (n, 2)).mean(axis=1)   # about -70 dBFS stereo hiss
+
+    def music(rng, t0, n, sr):
+        t = (t0 + np.arange(n)) / sr
+        return 0.1 * rng.standard_normal(n) + 0.3 * np.sin(2 * np.pi * 60.0 * t)
+
+    cal = BandCalibrator(16)
+    v, _ = _self_check_run(cal, hiss, 45)
+    frac = np.count_nonzero(v >= 1.0) / v.size
+    print(f"[CALIB] hiss-only: {100.0 * frac:.2f}% of band values non-zero (floor={cal.floor.round(5).tolist()})")
+    assert frac < 0.005, "hiss leaks through the learned noise floor"
+
+    v, usable = _self_check_run(cal, music, 60, seed=1)
+    lit = np.count_nonzero(v >= 1.0, axis=1)
+    print(f"[CALIB] music after 60 s: {lit.min()}..{lit.max()} of {usable} non-empty bands lit "
+          f"(floor={cal.floor.round(5).tolist()})")
+    assert lit.min() == usable, "sustained music is being learned as noise floor"
+    print("[CALIB] ok")
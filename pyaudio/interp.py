@@ -0,0 +1,103 @@
+# interp.py
+# Frame interpolation between audio analysis frames so LED output can run at a
+# fixed render rate (e.g. 100..120 FPS) independent of the analysis rate.
+#
+# The analysis side push()es one feature vector per analysed block; the render
+# side sample()s at its own pace. Values between the two latest frames are
+# blended with a cheap vectorized lerp (optionally eased); past the latest frame
+# they are extrapolated along the last slope for a bounded fraction of a frame.
+
+import threading, time
+import numpy as np
+
+MODES = ("lerp", "extrap", "hold")
+
+
+def smoothstep(u):
+    """Ease-in/out on u in 0..1 (works on scalars and arrays)."""
+    return u * u * (3.0 - 2.0 * u)
+
+
+class FrameInterpolator:
+    """Thread-safe interpolator for fixed-size float vectors (keeps the last 3 frames).
+
+    mode:
+      "lerp"   – render one analysis frame behind, blending prev→cur (smoothest).
+      "extrap" – render at the latest frame and continue its slope (lowest latency).
+      "hold"   – no blending, always return the latest frame (old behaviour).
+    """
+
+    def __init__(self, size, mode="lerp", ease=True, max_extrap=0.5, period=None):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        self.size = int(size)
+        self.mode = mode
+        self.ease = bool(ease)
+        self.max_extrap = float(max_extrap)  # frames we may run past the latest one
+        # Nominal frame period (e.g. BS / SR). Arrival times are jittery – ALSA often
+        # hands over two blocks back-to-back – so when set, frames are placed on a
+        # timeline spaced by the nominal period rather than by when they showed up.
+        self.period = float(period) if period else None
+        self._lock = threading.Lock()
+        # oldest → newest; a frame stamped ahead of real time still needs the
+        # segment before it, hence three frames rather than two
+        self._frames = [np.zeros(self.size, dtype=np.float32) for _ in range(3)]
+        self._times = [0.0, 0.0, 0.0]
+        self._count = 0
+
+    def push(self, values, t=None):
+        """Record a new analysis frame taken at time t (perf_counter seconds)."""
+        v = np.asarray(values, dtype=np.float32)
+        if v.shape != (self.size,):
+            raise ValueError(f"expected {self.size} values, got shape {v.shape}")
+        t = time.perf_counter() if t is None else float(t)
+        with self._lock:
+            if self.period and self._count:
+                # at least one period after the previous frame, but never more than
+                # one period ahead of real time so clock drift can't accumulate
+                t = min(max(t, self._times[2] + self.period), t + self.period)
+            # rotate buffers instead of allocating per frame
+            f = self._frames
+            f[0], f[1], f[2] = f[1], f[2], f[0]
+            f[2][:] = v
+            self._times = [self._times[1], self._times[2], t]
+            self._count += 1
+
+    @property
+    def ready(self):
+        return self._count > 0
+
+    def sample(self, t=None, out=None):
+        """Return the interpolated vector for render time t (perf_counter seconds)."""
+        t = time.perf_counter() if t is None else float(t)
+        if out is None:
+            out = np.empty(self.size, dtype=np.float32)
+        with self._lock:
+            f0, f1, f2 = self._frames
+            t1, t2 = self._times[1], self._times[2]
+            dt = self.period or (t2 - t1)
+            if self.mode == "hold" or self._count < 2 or dt <= 0.0:
+                out[:] = f2
+                return out
+
+            if self.mode == "lerp":
+                # one frame of latency: frame k is reached one period after its stamp.
+                # Before the newest frame's stamp we're still on the previous segment.
+                if t < t2 and self._count >= 3:
+                    a, b, u = f0, f1, (t - t1) / dt
+                else:
+                    a, b, u = f1, f2, (t - t2) / dt
+                u = min(1.0, max(0.0, u))
+                if self.ease:
+                    u = smoothstep(u)
+            else:
+                # extrapolate along the last slope, bounded so a stalled
+                # analysis thread can't run values off to infinity
+                a, b = f1, f2
+                u = 1.0 + min(self.max_extrap, max(-1.0, (t - t2) / dt))
+
+            # out = a + (b - a) * u, without temporaries
+            np.subtract(b, a, out=out)
+            out *= u
+            out += a
+        return out
@@ -7,12 +7,17 @@ import sounddevice as sd
 from typing import Optional
 import json
 
+from interp import FrameInterpolator
+
 # Environment variables
 DEVICE = os.getenv("INPUT_DEVICE", "hw:Loopback,1,0")
 RATE = int(os.getenv("SAMPLE_RATE", "44100"))
 FRAME = int(os.getenv("FRAME_SIZE", "1024"))
 HOST = os.getenv("WLED_HOST", "192.168.50.123")
 PORT = int(os.getenv("WLED_PORT", "21324"))
+ANALYSIS_FPS = float(os.getenv("ANALYSIS_FPS", "50"))
+RENDER_FPS = float(os.getenv("RENDER_FPS", "0"))  # 0 = send right after each analysis
+RENDER_MODE = os.getenv("RENDER_MODE", "lerp")
 
 # Audio analysis parameters
 CHANNELS = 2
@@ -20,11 +25,15 @@ DTYPE = 'float32'
 
 # Global variables for audio processing
 audio_data = np.zeros(FRAME)
+audio_seq = 0  # bumped by the callback for every new block
 data_lock = threading.Lock()
 running = False
 
 class AudioAnalyzer:
     def __init__(self):
+        if ANALYSIS_FPS <= 0:
+            raise ValueError(f"ANALYSIS_FPS must be > 0, got {ANALYSIS_FPS:g}")
+        
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.settimeout(0.1)  # Non-blocking
         
@@ -37,12 +46,21 @@ class AudioAnalyzer:
         self.num_leds = 144  # Adjust to your LED count
         self.brightness = 128  # 0-255
         
+        # Render stage: interpolates [volume, bands...] between analysis frames.
+        # New frames appear once per audio block, or less often if analysis is slower.
+        self.num_bands = 8
+        self.interp = None
+        if RENDER_FPS > 0:
+            self.interp = FrameInterpolator(1 + self.num_bands, mode=RENDER_MODE,
+                                            period=max(FRAME / RATE, 1.0 / ANALYSIS_FPS))
+        self.latest_peak_freq = 0.0
+        
         print(f"[AudioAnalyzer] Initialized for {self.num_leds} LEDs")
         print(f"[AudioAnalyzer] Target: {HOST}:{PORT}")
     
     def audio_callback(self, indata, frames, time, status):
         """Callback function for audio input"""
-        global audio_data, data_lock
+        global audio_data, audio_seq, data_lock
         
         if status:
             print(f"[Audio] Status: {status}")
@@ -52,6 +70,7 @@ class AudioAnalyzer:
         
         with data_lock:
             audio_data = mono_data.copy()
+            audio_seq += 1
     
     def analyze_audio(self, data):
         """Analyze audio data and extract features"""
@@ -70,7 +89,7 @@ class AudioAnalyzer:
         
         # Frequency bands for LED visualization
         # Split spectrum into bands (bass, mid, treble, etc.)
-        freq_bands = self.split_frequency_bands(magnitude)
+        freq_bands = self.split_frequency_bands(magnitude, self.num_bands)
         
         return {
             'volume': volume,
@@ -149,23 +168,46 @@ class AudioAnalyzer:
     
     def process_audio_loop(self):
         """Main audio processing loop"""
-        global audio_data, data_lock, running
+        global audio_data, audio_seq, data_lock, running
         
         print("[AudioAnalyzer] Starting processing loop...")
         
+        period = 1.0 / ANALYSIS_FPS
+        last_seq = -1
+        next_t = time.perf_counter()
+        
         while running:
             try:
+                next_t += period
+                now = time.perf_counter()
+                if next_t > now:
+                    time.sleep(next_t - now)
+                elif now - next_t > period:
+                    next_t = now  # Fell behind, resync instead of bursting
+                
                 with data_lock:
+                    seq = audio_seq
                     current_data = audio_data.copy()
                 
+                # Render stage only wants new blocks; re-pushing a block makes plateaus
+                if RENDER_FPS > 0 and seq == last_seq:
+                    continue
+                last_seq = seq
+                
                 # Analyze audio
                 analysis = self.analyze_audio(current_data)
                 
-                # Create LED visualization
-                led_data = self.create_led_data(analysis)
-                
-                # Send to WLED
-                self.send_to_wled(led_data)
+                if RENDER_FPS > 0:
+                    # Hand off to render loop
+                    if analysis is not None:
+                        self.latest_peak_freq = analysis['peak_freq']
+                        self.interp.push([analysis['volume'], *analysis['bands']])
+                else:
+                    # Create LED visualization
+                    led_data = self.create_led_data(analysis)
+                    
+                    # Send to WLED
+                    self.send_to_wled(led_data)
                 
                 # Debug output (occasionally)
                 if analysis and time.time() % 5 < 0.05:  # Every ~5 seconds
@@ -173,12 +215,42 @@ class AudioAnalyzer:
                           f"Peak: {analysis['peak_freq']:.0f}Hz, "
                           f"Bands: {len(analysis['bands'])}")
                 
-                time.sleep(0.02)  # ~50 FPS
-                
             except Exception as e:
                 print(f"[AudioAnalyzer] Processing error: {e}")
                 time.sleep(1)
     
+    def render_loop(self):
+        """Fixed-rate output loop sending interpolated frames"""
+        print(f"[AudioAnalyzer] Starting render loop at {RENDER_FPS:g} FPS ({RENDER_MODE})...")
+        
+        period = 1.0 / RENDER_FPS
+        vec = np.empty(1 + self.num_bands, dtype=np.float32)
+        next_t = time.perf_counter()
+        
+        while running:
+            next_t += period
+            now = time.perf_counter()
+            if next_t > now:
+                time.sleep(next_t - now)
+            elif now - next_t > period:
+                next_t = now  # Fell behind, resync instead of bursting
+            
+            if not self.interp.ready:
+                continue
+            
+            try:
+                self.interp.sample(out=vec)
+                np.maximum(vec, 0.0, out=vec)
+                analysis = {
+                    'volume': float(vec[0]),
+                    'bands': vec[1:],
+                    'peak_freq': self.latest_peak_freq
+                }
+                self.send_to_wled(self.create_led_data(analysis))
+            except Exception as e:
+                print(f"[AudioAnalyzer] Render error: {e}")
+                time.sleep(1)
+    
     def cleanup(self):
         """Cleanup resources"""
         try:
@@ -224,8 +296,13 @@ def main():
     print(f"Sample Rate: {RATE}")
     print(f"Frame Size: {FRAME}")
     print(f"WLED Target: {HOST}:{PORT}")
+    print(f"Analysis FPS: {ANALYSIS_FPS:g}  Render FPS: {RENDER_FPS:g}")
     print("="*60)
     
+    if ANALYSIS_FPS <= 0:
+        print(f"[ERROR] ANALYSIS_FPS must be > 0, got {ANALYSIS_FPS:g}")
+        return 1
+    
     # Wait for audio device
     if not wait_for_audio_device(DEVICE):
         print("[ERROR] Audio device not available!")
@@ -264,6 +341,11 @@ def main():
         process_thread.daemon = True
         process_thread.start()
         
+        if RENDER_FPS > 0:
+            render_thread = threading.Thread(target=analyzer.render_loop)
+            render_thread.daemon = True
+            render_thread.start()
+        
         # Start audio stream
         with sd.InputStream(
             device=DEVICE,
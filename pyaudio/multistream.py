@@ -0,0 +1,260 @@
+# multistream.py
+# Several audio zones in one process: opens N input PCMs (e.g. the snd-aloop
+# substreams the bridge creates with ALOOP_SUBS), each with its own feature
+# state, calibration and WLED target set, and runs their analysis on one shared
+# worker pool. Saves an interpreter + NumPy import per zone compared with one
+# wledAR2.py container per substream.
+#
+# Same env vars as wledAR2.py (SAMPLE_RATE, BLOCKSIZE, CHANNELS, GEQ/AGC/PEAK,
+# RENDER_*, CALIB_*), plus:
+#   STREAMS   "pcm=host[:port]|host[:port][@deadline];pcm=host..."  one entry per zone, e.g.
+#             "hw:Loopback,1,0=192.168.50.165;hw:Loopback,1,1=192.168.50.166|192.168.50.167:11988@1.5"
+#             Empty = single stream IN_PCM -> WLED_HOST:WLED_PORT.
+#   WORKERS   analysis threads shared by all streams (default: min(streams, cpus)).
+#   DEADLINE  per-block deadline as a multiple of the block duration (default 1.0);
+#             an entry's "@x" overrides it for that stream.
+#   STATS_S   seconds between per-stream stats lines (default 5). analysis_lat is
+#             callback -> analysis done; with RENDER_FPS > 0 the render stage adds
+#             up to one more block of delay on top.
+#
+#   python -u multistream.py
+
+import os, re, time, threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import numpy as np
+import sounddevice as sd
+
+import wledAR2 as ar
+from interp import FrameInterpolator
+
+STREAMS  = os.getenv("STREAMS", "")
+WORKERS  = int(os.getenv("WORKERS", "0"))          # 0 = min(streams, cpu count)
+DEADLINE = float(os.getenv("DEADLINE", "1.0"))     # 0.5..2; x block duration before a block counts as late
+STATS_S  = float(os.getenv("STATS_S", "5"))        # stats log interval
+
+
+def parse_streams(spec):
+    """Parse STREAMS into [(pcm, [(host, port), ...], deadline_factor), ...]."""
+    if not spec.strip():
+        return [(ar.IN_PCM, [(ar.HOST, ar.PORT)], DEADLINE)]
+    streams = []
+    for entry in spec.split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        pcm, sep, targets = entry.rpartition("=")
+        if not sep or not pcm or not targets:
+            raise ValueError(f"STREAMS entry {entry!r} must look like 'pcm=host[:port]|host[:port][@deadline]'")
+        targets, at, deadline = targets.partition("@")
+        deadline = float(deadline) if at else DEADLINE
+        if deadline <= 0:
+            raise ValueError(f"STREAMS entry {entry!r}: deadline must be > 0")
+        hosts = []
+        for t in targets.split("|"):
+            host, _, port = t.strip().partition(":")
+            hosts.append((host, int(port) if port else ar.PORT))
+        pcm = int(pcm) if pcm.isdigit() else pcm  # numeric PortAudio index
+        streams.append((pcm, hosts, deadline))
+    return streams
+
+
+def calib_path_for(pcm, single):
+    """Calibration file for one stream: CALIB_PATH as-is when there's only one
+    stream (shares wledAR2.py's learned state), else keyed on the PCM name so
+    reordering STREAMS can't hand one zone another zone's floors."""
+    if single:
+        return ar.CALIB_PATH
+    root, ext = os.path.splitext(ar.CALIB_PATH)
+    key = re.sub(r"[^A-Za-z0-9]+", "_", str(pcm if pcm is not None else "default")).strip("_")
+    return f"{root}.{key}{ext or '.json'}"
+
+
+class StreamStats:
+    """Counters for one stream; latency is windowed (reset by each log line), the rest are totals.
+
+    Workers record() while the main thread takes line(); both hold the lock so a
+    reset can't land between the latency fields.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.blocks = 0          # blocks analysed
+        self.xruns = 0           # PortAudio reported overflow/underflow
+        self.dropped = 0         # block arrived while the previous one was still queued/running
+        self.late = 0            # waited past its deadline in the pool, skipped
+        self.missed = 0          # analysed, but finished after its deadline
+        self.lat_sum = 0.0       # callback -> analysis done (packet sent, or handed to the render stage), seconds
+        self.lat_max = 0.0
+        self.lat_n = 0
+
+    def record(self, lat, deadline):
+        with self.lock:
+            self.blocks += 1
+            self.lat_sum += lat
+            self.lat_n += 1
+            self.lat_max = max(self.lat_max, lat)
+            if lat > deadline:
+                self.missed += 1
+
+    def line(self):
+        """Format the stats and start a new latency window."""
+        with self.lock:
+            avg = 1000.0 * self.lat_sum / self.lat_n if self.lat_n else 0.0
+            text = (f"blocks={self.blocks} xruns={self.xruns} dropped={self.dropped} late={self.late} "
+                    f"missed={self.missed} analysis_lat={avg:.2f}/{1000.0 * self.lat_max:.2f}ms")
+            self.lat_sum = self.lat_max = 0.0
+            self.lat_n = 0
+        return text
+
+
+class AudioStream:
+    """One input PCM with its own feature state, frame counter and WLED targets."""
+
+    def __init__(self, index, pcm, targets, pool, calib_path, deadline=DEADLINE):
+        self.index = index
+        self.pcm = pcm
+        self.targets = targets
+        self.pool = pool
+        self.features = ar.FeatureState()
+        self.calib_path = calib_path
+        self.deadline = deadline * ar.BS / ar.SR
+        self.frame = 0
+        self.busy = False
+        self.stats = StreamStats()
+        self.interp = None
+        if ar.RENDER_FPS > 0:
+            self.interp = FrameInterpolator(19, mode=ar.RENDER_MODE, ease=ar.RENDER_EASE,
+                                            max_extrap=ar.RENDER_EXTRAP, period=ar.BS / ar.SR)
+        self.latest_peak = 0
+        self.latest_hz = 0.0
+
+    @property
+    def name(self):
+        return f"#{self.index} {'default' if self.pcm is None else self.pcm}"
+
+    def callback(self, indata, frames, timeinfo, status):
+        """PortAudio thread: copy the block and hand it to the pool, never block."""
+        t_in = time.perf_counter()
+        if status:
+            self.stats.xruns += 1
+        if self.busy:
+            self.stats.dropped += 1
+            return
+        self.busy = True
+        try:
+            self.pool.submit(self.process, indata.copy(), t_in)
+        except RuntimeError:
+            # pool shutting down; don't leave the stream stuck as busy
+            self.busy = False
+            self.stats.dropped += 1
+
+    def process(self, block, t_in):
+        """Worker thread: analyse one block and send (or hand to the render stage)."""
+        try:
+            if time.perf_counter() - t_in > self.deadline:
+                self.stats.late += 1
+                return
+            sR, sS, peak, bands, mag, hz = self.features.compute(block)
+            if ar.RENDER_FPS > 0:
+                self.latest_peak, self.latest_hz = peak, hz
+                self.interp.push([sR, sS, mag, *bands])
+            else:
+                self.send(sR, sS, peak, bands, mag, hz)
+            self.stats.record(time.perf_counter() - t_in, self.deadline)
+        except Exception as e:
+            print(f"[STREAM {self.name}] analysis error: {e}", flush=True)
+        finally:
+            self.busy = False
+
+    def send(self, sampleRaw, sampleSmth, peak, bands, mag, hz):
+        self.frame = (self.frame + 1) & 0xFF
+        payload = ar.pack_frame(self.frame, sampleRaw, sampleSmth, peak, bands, mag, hz)
+        for addr in self.targets:
+            ar.sock.sendto(payload, addr)
+
+    def open(self):
+        return sd.InputStream(device=self.pcm, samplerate=ar.SR, channels=ar.CH,
+                              blocksize=ar.BS, dtype="float32", callback=self.callback)
+
+
+def render_loop(streams, stop):
+    """Send interpolated frames for every stream at a fixed RENDER_FPS."""
+    period = 1.0 / ar.RENDER_FPS
+    vec = np.empty(19, dtype=np.float32)
+    next_t = time.perf_counter()
+    while not stop.is_set():
+        next_t += period
+        now = time.perf_counter()
+        if next_t > now:
+            time.sleep(next_t - now)
+        elif now - next_t > period:
+            next_t = now  # fell behind; resync instead of bursting
+        for s in streams:
+            if not s.interp.ready:
+                continue
+            s.interp.sample(out=vec)
+            np.maximum(vec, 0.0, out=vec)
+            s.send(vec[0], vec[1], s.latest_peak, vec[3:], vec[2], s.latest_hz)
+
+
+def save_calibration(streams):
+    if not ar.CALIB:
+        return
+    for s in streams:
+        try:
+            s.features.calib.save(s.calib_path)
+        except OSError as e:
+            print(f"[CALIB] save to {s.calib_path} failed: {e}")
+
+
+def main():
+    specs = parse_streams(STREAMS)
+    workers = WORKERS or min(len(specs), os.cpu_count() or 1)
+    print(f"[MULTI] {len(specs)} stream(s) @ {ar.SR} Hz  BS={ar.BS}  CH={ar.CH}  WORKERS={workers}")
+    if ar.RENDER_FPS > 0:
+        print(f"[RENDER] FPS={ar.RENDER_FPS:g}  MODE={ar.RENDER_MODE}")
+
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis") as pool:
+        single = len(specs) == 1
+        streams = [AudioStream(i, pcm, targets, pool, calib_path_for(pcm, single), deadline)
+                   for i, (pcm, targets, deadline) in enumerate(specs)]
+        paths = [s.calib_path for s in streams]
+        if ar.CALIB and len(set(paths)) != len(paths):
+            raise ValueError(f"STREAMS map several streams to the same calibration file: {paths}")
+        for s in streams:
+            loaded = ar.CALIB and s.features.calib.load(s.calib_path)
+            dst = ", ".join(f"{h}:{p}" for h, p in s.targets)
+            print(f"[STREAM {s.name}] -> {dst}  deadline={1000.0 * s.deadline:.1f}ms"
+                  + ("  (calibration loaded)" if loaded else ""))
+
+        try:
+            with ExitStack() as stack:
+                for s in streams:
+                    stack.enter_context(s.open())
+                if ar.RENDER_FPS > 0:
+                    threading.Thread(target=render_loop, args=(streams, stop), daemon=True).start()
+                print("[MULTI] Streaming… Ctrl+C to stop")
+
+                last_stats = last_save = time.time()
+                while True:
+                    time.sleep(1)
+                    now = time.time()
+                    if now - last_stats >= STATS_S:
+                        for s in streams:
+                            print(f"[STREAM {s.name}] {s.stats.line()}", flush=True)
+                        last_stats = now
+                    if now - last_save >= ar.CALIB_SAVE_S:
+                        save_calibration(streams)
+                        last_save = now
+        finally:
+            stop.set()
+            save_calibration(streams)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nStopped.")
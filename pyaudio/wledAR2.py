@@ -6,6 +6,9 @@ import os, socket, struct, time, math
 import numpy as np
 import sounddevice as sd
 
+from interp import FrameInterpolator
+from calibrate import BandCalibrator
+
 # ── Network / device ────────────────────────────────────────────────────────────
 HOST = os.getenv("WLED_HOST", "192.168.50.165")  # WLED IP (unicast). Valid: any reachable IP.
 PORT = int(os.getenv("WLED_PORT", "11988"))      # Must match WLED Sync→Receive. Typical: 11988.
@@ -27,6 +30,16 @@ BAND_COMP_EXP = float(os.getenv("BAND_COMP_EXP", "0.45"))   # 0.35..0.8; lower =
 BAND_SCALE    = float(os.getenv("BAND_SCALE", "220"))      # INCREASED: 64..250; overall intensity of bins.
 BAND_FLOOR    = float(os.getenv("BAND_FLOOR", "0.01"))    # REDUCED: help with noise floor
 
+# ── Per-band calibration (replaces the global BAND_FLOOR when enabled) ──────────
+CALIB          = os.getenv("CALIB", "1") == "1"             # 1 = learn per-band noise floor + level; 0 = use BAND_FLOOR.
+CALIB_QUANTILE = float(os.getenv("CALIB_QUANTILE", "0.95")) # 0.9..0.99; percentile of quiet-block band level treated as the floor.
+CALIB_STEP     = float(os.getenv("CALIB_STEP", "0.02"))     # 0.005..0.05; floor adaptation speed (log step per block).
+CALIB_MARGIN   = float(os.getenv("CALIB_MARGIN", "2"))      # 1..3; subtract floor x MARGIN. Lower = more detail, more hiss.
+CALIB_QUIET    = float(os.getenv("CALIB_QUIET", "0.01"))    # block RMS (~-40 dBFS) above which the floor never learns.
+CALIB_NORM     = float(os.getenv("CALIB_NORM", "0.5"))      # 0..1; how strongly bands are pulled to a common level.
+CALIB_PATH     = os.getenv("CALIB_PATH", "band_calib.json") # learned floors persisted here across restarts.
+CALIB_SAVE_S   = float(os.getenv("CALIB_SAVE_S", "60"))     # seconds between saves.
+
 # ── AGC (auto gain control) for sampleSmth ──────────────────────────────────────
 # FIXED: Better values for WLED effects compatibility
 AGC_TARGET   = float(os.getenv("AGC_TARGET", "1.0"))       # REDUCED: 0.8..1.2; target for normalized level
@@ -40,6 +53,12 @@ PEAK_RELEASE = float(os.getenv("PEAK_RELEASE", "0.05"))    # 0.02..0.2; how fast
 PEAK_THRESH  = float(os.getenv("PEAK_THRESH",  "1.15"))    # REDUCED: 1.1..1.3; easier to trigger peaks
 PEAK_HOLD_MS = int(os.getenv("PEAK_HOLD_MS",   "160"))     # 40..200 ms; hold flag so effects see the beat.
 
+# ── Render stage (decouples LED output rate from analysis rate) ─────────────────
+RENDER_FPS    = float(os.getenv("RENDER_FPS", "0"))        # 0 = send once per audio block (old behaviour); 60..120 typical.
+RENDER_MODE   = os.getenv("RENDER_MODE", "lerp")           # lerp (smooth, +1 frame latency) | extrap (low latency) | hold.
+RENDER_EASE   = os.getenv("RENDER_EASE", "1") == "1"       # 1 = smoothstep easing for lerp mode.
+RENDER_EXTRAP = float(os.getenv("RENDER_EXTRAP", "0.5"))   # 0..1; max fraction of a frame extrap may run ahead.
+
 # ── Wire format (44 bytes) ─────────────────────────────────────────────────────
 HEADER = b"00002\x00"                      # 6 bytes including NUL
 PACK_FMT_44 = "<6s 2x f f B B 16B 2x f f"  # little-endian; explicit pads to reach 44 bytes
@@ -48,126 +67,212 @@ assert struct.calcsize(PACK_FMT_44) == 44
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 _frame = 0  # 0..255 rolling frame counter
 
-# Internal state
-_rms_smooth = 0.0          # smoothed pre-AGC RMS
-_env = 0.0                 # beat envelope (on |x|)
-_last_peak_time = 0.0
-_agc_gain = 1.0            # smoothed AGC gain so sampleSmth approaches AGC_TARGET
-_long_term_avg = 0.0       # NEW: longer term average for better AGC stability
+# Render stage state: interpolated vector = [sampleRaw, sampleSmth, FFT_Magnitude, bands16...]
+# (only built when rendering, so RENDER_* typos can't break the default per-block path)
+_interp = None
+if RENDER_FPS > 0:
+    _interp = FrameInterpolator(19, mode=RENDER_MODE, ease=RENDER_EASE, max_extrap=RENDER_EXTRAP,
+                                period=BS / SR)
+_latest_peak = 0           # peak flag / major peak are not blended, latest value is sent as-is
+_latest_hz = 0.0
+_last_calib_save = 0.0
 
-def send_packet(sampleRaw, sampleSmth, peak, bands, mag, hz):
-    """Pack and send one 44B V2 telemetry frame."""
-    global _frame
-    _frame = (_frame + 1) & 0xFF
+class FeatureState:
+    """Per-stream analysis state (smoothers, beat envelope, AGC, band calibration).
+
+    One instance per audio input; the module-level compute_features() uses a
+    default instance so single-stream callers don't need to care.
+    """
+
+    def __init__(self):
+        self.rms_smooth = 0.0          # smoothed pre-AGC RMS
+        self.env = 0.0                 # beat envelope (on |x|)
+        self.last_peak_time = 0.0
+        self.agc_gain = 1.0            # smoothed AGC gain so sampleSmth approaches AGC_TARGET
+        self.long_term_avg = 0.0       # NEW: longer term average for better AGC stability
+        self.calib = BandCalibrator(16, quantile=CALIB_QUANTILE, floor_step=CALIB_STEP,
+                                    norm_strength=CALIB_NORM, init_floor=BAND_FLOOR,
+                                    margin=CALIB_MARGIN, quiet_rms=CALIB_QUIET)
+        self.raw_bands = np.zeros(16, dtype=np.float32)
+
+    def compute(self, block):
+        """Return (sampleRaw, sampleSmth, peak_flag, bands16, FFT_Magnitude, FFT_MajorPeak)."""
+        # mono mix
+        x = block.mean(axis=1).astype(np.float32)
+
+        # windowed FFT
+        win = np.hanning(len(x)).astype(np.float32)
+        X = np.fft.rfft(x * win)
+        mag = np.abs(X).astype(np.float32)
+        freqs = np.fft.rfftfreq(len(x), 1.0 / SR).astype(np.float32)
+
+        # Loudness (RMS) - keep this as-is for sampleRaw
+        rms = float(np.sqrt(np.mean(x * x) + 1e-12))
+        self.rms_smooth = 0.95 * self.rms_smooth + 0.05 * rms
+
+        # NEW: Longer term average for more stable AGC
+        self.long_term_avg = 0.999 * self.long_term_avg + 0.001 * rms
+
+        # Envelope follower on |x| for beat detection
+        absx = float(np.abs(x).mean())
+        if absx > self.env:
+            self.env = PEAK_ATTACK * absx + (1.0 - PEAK_ATTACK) * self.env
+        else:
+            self.env = PEAK_RELEASE * absx + (1.0 - PEAK_RELEASE) * self.env
+
+        # Adaptive peak: instantaneous level vs envelope
+        now = time.time()
+        peak_flag = 0
+        if self.env > 1e-6 and (absx / max(self.env, 1e-6)) > PEAK_THRESH:
+            peak_flag = 1
+            self.last_peak_time = now
+        # hold so effects catch it
+        if (now - self.last_peak_time) * 1000.0 < PEAK_HOLD_MS:
+            peak_flag = 1
+
+        # IMPROVED AGC: Use combination of short and long term averages
+        # This provides better stability while maintaining responsiveness
+        agc_input = max(self.rms_smooth, self.long_term_avg * 1.5)  # Use whichever is higher
+        target_gain = (AGC_TARGET / agc_input) if agc_input > 1e-9 else AGC_MAX_GAIN
+
+        # Clamp the target gain to reasonable bounds
+        target_gain = max(AGC_MIN_GAIN, min(AGC_MAX_GAIN, target_gain))
+
+        # Smooth the gain changes
+        alpha = max(0.0, min(1.0, AGC_STRENGTH))
+        self.agc_gain = (1.0 - alpha) * self.agc_gain + alpha * target_gain
+
+        sampleRaw  = rms
+        # FIXED: Better ceiling and scaling for WLED effects
+        sampleSmth = min(rms * self.agc_gain, 1.8)  # Lower ceiling, better for most effects
+
+        # 16 GEQ bands - improved scaling
+        raw = self.raw_bands
+        for i in range(16):
+            lo, hi = BAND_EDGES[i], BAND_EDGES[i + 1]
+            m = (freqs >= lo) & (freqs < hi)
+            raw[i] = mag[m].mean() if m.any() else 0.0
+        if CALIB:
+            v = self.calib.update(raw, rms)            # per-band floor + level normalization
+        else:
+            v = np.maximum(raw - BAND_FLOOR, 0.0)      # global noise floor
+        v = v * (self.agc_gain * 0.8)                  # tie spectrum to AGC but slightly reduce
+        bands = (np.power(v, BAND_COMP_EXP) * BAND_SCALE).tolist()
+
+        # Dominant frequency (for hue-reactive modes) — skip DC bin
+        if len(mag) > 1:
+            idx = int(np.argmax(mag[1:])) + 1
+        else:
+            idx = 0
+        FFT_Magnitude = float(mag[idx]) * self.agc_gain  # Apply AGC to magnitude too
+        FFT_MajorPeak = float(freqs[idx]) if idx < len(freqs) else 0.0
+
+        return sampleRaw, sampleSmth, peak_flag, bands, FFT_Magnitude, FFT_MajorPeak
+
+_features = FeatureState()
+
+def pack_frame(frame, sampleRaw, sampleSmth, peak, bands, mag, hz):
+    """Pack one 44B V2 telemetry frame with an explicit frame counter."""
     # clip bands to uint8
     b = [int(max(0, min(255, int(v)))) for v in bands]
     # clamp freq like firmware does (won't hurt if WLED clamps again)
     hz = float(min(11025.0, max(1.0, hz)))
-    payload = struct.pack(PACK_FMT_44, HEADER, float(sampleRaw), float(sampleSmth),
-                          int(peak) & 0xFF, _frame, *b, float(mag), hz)
-    sock.sendto(payload, (HOST, PORT))
+    return struct.pack(PACK_FMT_44, HEADER, float(sampleRaw), float(sampleSmth),
+                       int(peak) & 0xFF, frame & 0xFF, *b, float(mag), hz)
+
+def encode_packet(sampleRaw, sampleSmth, peak, bands, mag, hz):
+    """Pack one 44B V2 telemetry frame (advances the frame counter)."""
+    global _frame
+    _frame = (_frame + 1) & 0xFF
+    return pack_frame(_frame, sampleRaw, sampleSmth, peak, bands, mag, hz)
+
+def send_packet(sampleRaw, sampleSmth, peak, bands, mag, hz):
+    """Pack and send one 44B V2 telemetry frame."""
+    sock.sendto(encode_packet(sampleRaw, sampleSmth, peak, bands, mag, hz), (HOST, PORT))
 
 def compute_features(block):
     """Return (sampleRaw, sampleSmth, peak_flag, bands16, FFT_Magnitude, FFT_MajorPeak)."""
-    global _rms_smooth, _env, _last_peak_time, _agc_gain, _long_term_avg
-
-    # mono mix
-    x = block.mean(axis=1).astype(np.float32)
-
-    # windowed FFT
-    win = np.hanning(len(x)).astype(np.float32)
-    X = np.fft.rfft(x * win)
-    mag = np.abs(X).astype(np.float32)
-    freqs = np.fft.rfftfreq(len(x), 1.0 / SR).astype(np.float32)
-
-    # Loudness (RMS) - keep this as-is for sampleRaw
-    rms = float(np.sqrt(np.mean(x * x) + 1e-12))
-    _rms_smooth = 0.95 * _rms_smooth + 0.05 * rms
-    
-    # NEW: Longer term average for more stable AGC
-    _long_term_avg = 0.999 * _long_term_avg + 0.001 * rms
-
-    # Envelope follower on |x| for beat detection
-    absx = float(np.abs(x).mean())
-    if absx > _env:
-        _env = PEAK_ATTACK * absx + (1.0 - PEAK_ATTACK) * _env
-    else:
-        _env = PEAK_RELEASE * absx + (1.0 - PEAK_RELEASE) * _env
+    return _features.compute(block)
 
-    # Adaptive peak: instantaneous level vs envelope
+def save_calibration(force=False):
+    """Persist learned band floors every CALIB_SAVE_S (called off the audio thread)."""
+    global _last_calib_save
+    if not CALIB:
+        return
     now = time.time()
-    peak_flag = 0
-    if _env > 1e-6 and (absx / max(_env, 1e-6)) > PEAK_THRESH:
-        peak_flag = 1
-        _last_peak_time = now
-    # hold so effects catch it
-    if (now - _last_peak_time) * 1000.0 < PEAK_HOLD_MS:
-        peak_flag = 1
-
-    # IMPROVED AGC: Use combination of short and long term averages
-    # This provides better stability while maintaining responsiveness
-    agc_input = max(_rms_smooth, _long_term_avg * 1.5)  # Use whichever is higher
-    target_gain = (AGC_TARGET / agc_input) if agc_input > 1e-9 else AGC_MAX_GAIN
-    
-    # Clamp the target gain to reasonable bounds
-    target_gain = max(AGC_MIN_GAIN, min(AGC_MAX_GAIN, target_gain))
-    
-    # Smooth the gain changes
-    alpha = max(0.0, min(1.0, AGC_STRENGTH))
-    _agc_gain = (1.0 - alpha) * _agc_gain + alpha * target_gain
-
-    sampleRaw  = rms
-    # FIXED: Better ceiling and scaling for WLED effects
-    sampleSmth = min(rms * _agc_gain, 1.8)  # Lower ceiling, better for most effects
-
-    # 16 GEQ bands - improved scaling
-    bands = []
-    for i in range(16):
-        lo, hi = BAND_EDGES[i], BAND_EDGES[i + 1]
-        m = (freqs >= lo) & (freqs < hi)
-        v = float(mag[m].mean()) if m.any() else 0.0
-        v = max(0.0, v - BAND_FLOOR)   # noise floor
-        v *= _agc_gain * 0.8           # tie spectrum to AGC but slightly reduce
-        v = (v ** BAND_COMP_EXP) * BAND_SCALE
-        bands.append(v)
-
-    # Dominant frequency (for hue-reactive modes) — skip DC bin
-    if len(mag) > 1:
-        idx = int(np.argmax(mag[1:])) + 1
-    else:
-        idx = 0
-    FFT_Magnitude = float(mag[idx]) * _agc_gain  # Apply AGC to magnitude too
-    FFT_MajorPeak = float(freqs[idx]) if idx < len(freqs) else 0.0
+    if not force and now - _last_calib_save < CALIB_SAVE_S:
+        return
+    _last_calib_save = now
+    try:
+        _features.calib.save(CALIB_PATH)
+    except OSError as e:
+        print(f"[CALIB] save to {CALIB_PATH} failed: {e}")
 
-    return sampleRaw, sampleSmth, peak_flag, bands, FFT_Magnitude, FFT_MajorPeak
+def render_loop():
+    """Send interpolated frames at a fixed RENDER_FPS until interrupted."""
+    period = 1.0 / RENDER_FPS
+    vec = np.empty(19, dtype=np.float32)
+    next_t = time.perf_counter()
+    while True:
+        next_t += period
+        now = time.perf_counter()
+        if next_t > now:
+            time.sleep(next_t - now)
+        elif now - next_t > period:
+            next_t = now  # fell behind (GC, scheduler); resync instead of bursting
+        save_calibration()
+        if not _interp.ready:
+            continue
+        _interp.sample(out=vec)
+        np.maximum(vec, 0.0, out=vec)  # extrapolation may undershoot
+        send_packet(vec[0], vec[1], _latest_peak, vec[3:], vec[2], _latest_hz)
 
 def main():
     print(f"[AUDIO] {IN_PCM or 'default'} @ {SR} Hz  BS={BS}  CH={CH}  -> {HOST}:{PORT}")
     print(f"[GEQ]  F_MIN={F_MIN}Hz  F_MAX={F_MAX}Hz  SCALE={BAND_SCALE}  COMP_EXP={BAND_COMP_EXP}  FLOOR={BAND_FLOOR}")
     print(f"[AGC]  TARGET={AGC_TARGET}  STRENGTH={AGC_STRENGTH}  MIN/MAX_GAIN={AGC_MIN_GAIN}/{AGC_MAX_GAIN}")
     print(f"[PEAK] ATTACK={PEAK_ATTACK}  RELEASE={PEAK_RELEASE}  THRESH={PEAK_THRESH}  HOLD={PEAK_HOLD_MS}ms")
+    if CALIB:
+        loaded = _features.calib.load(CALIB_PATH)
+        print(f"[CALIB] QUANTILE={CALIB_QUANTILE}  STEP={CALIB_STEP}  MARGIN={CALIB_MARGIN}  QUIET={CALIB_QUIET}  NORM={CALIB_NORM}  "
+              f"{'loaded' if loaded else 'new'} state {CALIB_PATH}")
+    else:
+        print(f"[CALIB] off (global FLOOR={BAND_FLOOR})")
+    if RENDER_FPS > 0:
+        print(f"[RENDER] FPS={RENDER_FPS:g}  MODE={RENDER_MODE}  EASE={int(RENDER_EASE)}  EXTRAP={RENDER_EXTRAP}")
+    else:
+        print("[RENDER] off (one packet per audio block)")
     last_log = 0.0
 
     def cb(indata, frames, timeinfo, status):
+        global _latest_peak, _latest_hz
         nonlocal last_log
         if status:
             print("Audio status:", status, flush=True)
         sR, sS, peak, bands, mag, hz = compute_features(indata.copy())
-        send_packet(sR, sS, peak, bands, mag, hz)
+        if RENDER_FPS > 0:
+            _latest_peak, _latest_hz = peak, hz
+            _interp.push([sR, sS, mag, *bands])
+        else:
+            send_packet(sR, sS, peak, bands, mag, hz)
         now = time.time()
         if now - last_log > 1.0:
             # Enhanced logging to help with tuning
-            print(f"rms={sR:.3f} smth={sS:.3f} gain={_agc_gain:.2f} peak={peak} bands={int(min(bands))}..{int(max(bands))} mag={mag:.2f} hz={hz:.0f}")
+            print(f"rms={sR:.3f} smth={sS:.3f} gain={_features.agc_gain:.2f} peak={peak} bands={int(min(bands))}..{int(max(bands))} mag={mag:.2f} hz={hz:.0f}")
             last_log = now
 
     with sd.InputStream(device=IN_PCM, samplerate=SR, channels=CH,
                         blocksize=BS, dtype="float32", callback=cb):
         print("[AUDIO] Streaming… Ctrl+C to stop")
+        if RENDER_FPS > 0:
+            render_loop()
         while True:
             time.sleep(1)
+            save_calibration()
 
 if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
+        save_calibration(force=True)
         print("\nStopped.")
\ No newline at end of file